@@ -2,8 +2,8 @@
 from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-from pydantic import BaseModel
-from typing import Optional, Dict, Any, List
+from pydantic import BaseModel, Field
+from typing import Optional, Dict, Any, List, Literal
 from datetime import datetime
 from app.database import get_db, AsyncSessionLocal
 from app.models import Settings
@@ -27,6 +27,10 @@ class TelegramSettings(BaseModel):
     backup_enabled: bool = False
     backup_interval: int = 60
     backup_interval_unit: str = "minutes"
+    backup_compress_level: int = Field(6, ge=0, le=9)
+    mode: Literal["polling", "webhook"] = "polling"
+    webhook_url: Optional[str] = None  # Public URL of /api/telegram/webhook
+    webhook_secret: Optional[str] = Field(None, pattern=r"^[A-Za-z0-9_-]{1,256}$")
 
 
 class TunnelSettings(BaseModel):
@@ -65,7 +69,11 @@ async def get_settings(db: AsyncSession = Depends(get_db)):
             "admin_ids": telegram_settings.get("admin_ids", []),
             "backup_enabled": telegram_settings.get("backup_enabled", False),
             "backup_interval": telegram_settings.get("backup_interval", 60),
-            "backup_interval_unit": telegram_settings.get("backup_interval_unit", "minutes")
+            "backup_interval_unit": telegram_settings.get("backup_interval_unit", "minutes"),
+            "backup_compress_level": telegram_settings.get("backup_compress_level", 6),
+            "mode": telegram_settings.get("mode", "polling"),
+            "webhook_url": telegram_settings.get("webhook_url"),
+            "webhook_secret": telegram_settings.get("webhook_secret")
         },
         "tunnel": {
             "auto_reapply_enabled": tunnel_settings.get("auto_reapply_enabled", False) if tunnel_settings else False,
@@ -123,10 +131,17 @@ async def update_settings(settings_update: SettingsUpdate, request: Request, db:
         setting = result.scalar_one_or_none()
         
         old_enabled = False
+        old_value = {}
         if setting and setting.value:
             old_enabled = setting.value.get("enabled", False)
+            old_value = dict(setting.value)
         
         new_enabled = settings_update.telegram.enabled
+        new_value = settings_update.telegram.dict(exclude_none=True)
+        connection_changed = any(
+            old_value.get(key) != new_value.get(key)
+            for key in ("bot_token", "mode", "webhook_url", "webhook_secret")
+        )
         
         if setting:
             setting.value = settings_update.telegram.dict(exclude_none=True)
@@ -140,6 +155,7 @@ async def update_settings(settings_update: SettingsUpdate, request: Request, db:
         
         await db.commit()
         await db.refresh(setting)
+        telegram_bot.invalidate_settings()
         
         if new_enabled and not old_enabled:
             try:
@@ -150,6 +166,12 @@ async def update_settings(settings_update: SettingsUpdate, request: Request, db:
         elif not new_enabled and old_enabled:
             await telegram_bot.stop()
             logger.info("Telegram bot stopped")
+        elif new_enabled and old_enabled and connection_changed:
+            try:
+                await telegram_bot.start()
+                logger.info("Telegram bot restarted")
+            except Exception as e:
+                logger.error(f"Failed to restart Telegram bot: {e}", exc_info=True)
         elif new_enabled and old_enabled:
             await telegram_bot.start_backup_task()
             logger.info("Telegram bot backup task restarted")
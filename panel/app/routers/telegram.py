@@ -0,0 +1,27 @@
+"""Telegram webhook endpoint"""
+from fastapi import APIRouter, HTTPException, Request
+import logging
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+@router.post("/webhook")
+async def telegram_webhook(request: Request):
+    """Receive updates pushed by Telegram when the bot runs in webhook mode"""
+    from app.telegram_bot import telegram_bot
+    
+    if not telegram_bot.webhook_active:
+        raise HTTPException(status_code=404, detail="Telegram webhook is not enabled")
+    
+    if not telegram_bot.verify_webhook_secret(request.headers.get("X-Telegram-Bot-Api-Secret-Token")):
+        raise HTTPException(status_code=403, detail="Invalid secret token")
+    
+    try:
+        data = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid JSON body")
+    
+    await telegram_bot.process_webhook_update(data)
+    return {"status": "ok"}
@@ -1,46 +1,85 @@
 """Telegram bot for panel management"""
+from __future__ import annotations
+
 import asyncio
+import functools
+import importlib.util
+import io
 import logging
 import os
-import shutil
-import zipfile
+import re
+import secrets
+import sqlite3
+import tempfile
 from pathlib import Path
-from typing import Optional, List, Dict, Any
+from typing import TYPE_CHECKING, Optional, List, Dict, Any, Tuple, FrozenSet, IO
 from datetime import datetime
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from app.database import AsyncSessionLocal
+from sqlalchemy import select, func
+from app.database import AsyncSessionLocal, engine
 from app.models import Node, Tunnel, Settings
 import httpx
 
 logger = logging.getLogger(__name__)
 
-try:
-    from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton  # type: ignore
-    from telegram.ext import (  # type: ignore
-        Application, CommandHandler, CallbackQueryHandler, ContextTypes,
-        ConversationHandler, MessageHandler, filters
-    )
-    TELEGRAM_AVAILABLE = True
-except ImportError:
-    TELEGRAM_AVAILABLE = False
-    Update = None  # type: ignore
-    InlineKeyboardButton = None  # type: ignore
-    InlineKeyboardMarkup = None  # type: ignore
-    ReplyKeyboardMarkup = None  # type: ignore
-    KeyboardButton = None  # type: ignore
-    Application = None  # type: ignore
-    CommandHandler = None  # type: ignore
-    CallbackQueryHandler = None  # type: ignore
-    ContextTypes = None  # type: ignore
-    ConversationHandler = None  # type: ignore
-    MessageHandler = None  # type: ignore
-    filters = None  # type: ignore
+# python-telegram-bot is imported on first use so panels without the bot enabled don't pay for it
+TELEGRAM_AVAILABLE = importlib.util.find_spec("telegram") is not None
+if not TELEGRAM_AVAILABLE:
     logger.warning("python-telegram-bot not installed. Telegram bot will not work.")
 
+if TYPE_CHECKING:
+    from telegram import Update, ReplyKeyboardMarkup, InputFile  # type: ignore
+    from telegram.ext import Application, ContextTypes  # type: ignore
+
 
 # No conversation states needed
 
+ACCESS_DENIED = "❌ Access denied. You are not an admin."
+
+TRANSLATIONS = {
+    "welcome": "👋 Welcome to Smite Panel Bot!\n\nSelect an action:",
+    "access_denied": ACCESS_DENIED,
+    "node_stats": "📊 Node Stats",
+    "tunnel_stats": "📊 Tunnel Stats",
+    "logs": "📋 Logs",
+    "backup": "📦 Backup",
+    "no_nodes": "📭 No nodes found.",
+    "no_tunnels": "📭 No tunnels found.",
+    "error": "❌ Error: {error}",
+}
+
+HELP_TEXT = """📋 Available Commands:
+
+/start - Show main menu
+/nodes - List all nodes
+/tunnels - List all tunnels
+/status - Show panel status
+/logs - Show recent logs
+/backup - Create and send backup
+
+Use buttons in messages to interact with nodes and tunnels."""
+
+# Files smaller than this (bytes) are stored uncompressed in backups
+BACKUP_STORE_THRESHOLD = 4096
+
+# Maximum number of rows listed in the node/tunnel stats messages
+NODES_DISPLAY_LIMIT = 50
+TUNNELS_DISPLAY_LIMIT = 10
+
+
+
+def admin_required(handler):
+    """Reply with access denied and skip the command handler for non-admin users"""
+    @functools.wraps(handler)
+    async def wrapper(self, update, context):
+        user = update.effective_user
+        if user is None or user.id not in self._admin_ids_int:
+            if update.message:
+                await update.message.reply_text(ACCESS_DENIED, reply_markup=self._get_keyboard(user.id if user else 0))
+            return
+        return await handler(self, update, context)
+    return wrapper
+
 
 class TelegramBot:
     """Telegram bot for managing panel"""
@@ -49,56 +88,85 @@ class TelegramBot:
         self.application: Optional[Application] = None
         self.enabled = False
         self.bot_token: Optional[str] = None
-        self.admin_ids: List[str] = []
+        self.admin_ids: FrozenSet[str] = frozenset()
+        self._admin_ids_int: FrozenSet[int] = frozenset()
         self.backup_task: Optional[asyncio.Task] = None
         self.backup_enabled = False
         self.backup_interval = 60
         self.backup_interval_unit = "minutes"
+        self.backup_compress_level = 6
+        self.mode = "polling"
+        self.webhook_url: Optional[str] = None
+        self.webhook_secret: Optional[str] = None
+        self.webhook_active = False
+        self._webhook_token: Optional[str] = None
         self.user_states: Dict[int, Dict[str, Any]] = {}
+        self._keyboard: Optional[ReplyKeyboardMarkup] = None
+        # Settings are served from the attributes above until invalidate_settings() marks them stale
+        self._settings_dirty = True
+        self._settings_lock = asyncio.Lock()
+        # Wakes the backup loop so interval changes apply without waiting out the current sleep
+        self._settings_changed = asyncio.Event()
         api_url = os.getenv("PANEL_API_URL")
         if not api_url:
             api_url = os.getenv("BACKEND_URL", "http://localhost:8000")
         self.api_base_url = api_url
     
+    def invalidate_settings(self):
+        """Mark cached settings as stale so the next load_settings() hits the database"""
+        self._settings_dirty = True
+        self._settings_changed.set()
+    
     async def load_settings(self):
-        """Load settings from database"""
-        async with AsyncSessionLocal() as session:
-            result = await session.execute(select(Settings).where(Settings.key == "telegram"))
-            setting = result.scalar_one_or_none()
-            if setting and setting.value:
-                self.enabled = setting.value.get("enabled", False)
-                self.bot_token = setting.value.get("bot_token")
-                self.admin_ids = setting.value.get("admin_ids", [])
-                self.backup_enabled = setting.value.get("backup_enabled", False)
-                self.backup_interval = setting.value.get("backup_interval", 60)
-                self.backup_interval_unit = setting.value.get("backup_interval_unit", "minutes")
+        """Load settings from database (served from cache until invalidated)"""
+        if not self._settings_dirty:
+            return
+        
+        async with self._settings_lock:
+            if not self._settings_dirty:
+                return
+            
+            async with AsyncSessionLocal() as session:
+                result = await session.execute(select(Settings).where(Settings.key == "telegram"))
+                setting = result.scalar_one_or_none()
+                value = setting.value if setting and setting.value else None
+            
+            if value:
+                self.enabled = value.get("enabled", False)
+                self.bot_token = value.get("bot_token")
+                self.admin_ids = frozenset(map(str, value.get("admin_ids", [])))
+                self.backup_enabled = value.get("backup_enabled", False)
+                self.backup_interval = value.get("backup_interval", 60)
+                self.backup_interval_unit = value.get("backup_interval_unit", "minutes")
+                self.backup_compress_level = value.get("backup_compress_level", 6)
+                self.mode = value.get("mode", "polling")
+                self.webhook_url = value.get("webhook_url")
+                self.webhook_secret = value.get("webhook_secret")
             else:
                 self.enabled = False
                 self.bot_token = None
-                self.admin_ids = []
+                self.admin_ids = frozenset()
                 self.backup_enabled = False
                 self.backup_interval = 60
                 self.backup_interval_unit = "minutes"
+                self.backup_compress_level = 6
+                self.mode = "polling"
+                self.webhook_url = None
+                self.webhook_secret = None
+            
+            self._admin_ids_int = frozenset(int(a) for a in self.admin_ids if re.fullmatch(r"\s*-?\d+\s*", a))
+            
+            # Only mark the cache fresh once every field above was applied
+            self._settings_dirty = False
     
     def t(self, user_id: int, key: str, **kwargs) -> str:
         """Get text (simplified - no translations)"""
-        translations = {
-            "welcome": "👋 Welcome to Smite Panel Bot!\n\nSelect an action:",
-            "access_denied": "❌ Access denied. You are not an admin.",
-            "node_stats": "📊 Node Stats",
-            "tunnel_stats": "📊 Tunnel Stats",
-            "logs": "📋 Logs",
-            "backup": "📦 Backup",
-            "no_nodes": "📭 No nodes found.",
-            "no_tunnels": "📭 No tunnels found.",
-            "error": "❌ Error: {error}",
-        }
-        text = translations.get(key, key)
+        text = TRANSLATIONS.get(key, key)
         return text.format(**kwargs) if kwargs else text
     
     def is_admin(self, user_id: int) -> bool:
         """Check if user is admin"""
-        return str(user_id) in self.admin_ids
+        return user_id in self._admin_ids_int
     
     async def start(self):
         """Start Telegram bot"""
@@ -115,8 +183,18 @@ class TelegramBot:
         # Stop existing instance if running
         await self.stop()
         
+        use_webhook = self.mode == "webhook" and bool(self.webhook_url)
+        if self.mode == "webhook" and not use_webhook:
+            logger.warning("Telegram webhook mode selected but webhook_url is not set, falling back to polling")
+        
         try:
-            self.application = Application.builder().token(self.bot_token).build()
+            from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, filters  # type: ignore
+            
+            builder = Application.builder().token(self.bot_token)
+            if use_webhook:
+                # Updates arrive through the panel's /api/telegram/webhook route, no updater needed
+                builder = builder.updater(None)
+            self.application = builder.build()
             
             self.application.add_handler(CommandHandler("start", self.cmd_start))
             self.application.add_handler(CommandHandler("help", self.cmd_help))
@@ -139,8 +217,18 @@ class TelegramBot:
             await self.application.initialize()
             await self.application.start()
             
+            if use_webhook:
+                # Telegram pushes updates to the panel, so nothing runs while the bot is idle
+                self._webhook_token = self.webhook_secret or secrets.token_urlsafe(32)
+                await self.application.bot.set_webhook(
+                    url=self.webhook_url,
+                    secret_token=self._webhook_token,
+                    drop_pending_updates=True
+                )
+                self.webhook_active = True
+                logger.info(f"Telegram bot webhook set to {self.webhook_url}")
             # Start polling using updater (PTB v20+ way for existing event loop)
-            if hasattr(self.application, 'updater') and self.application.updater:
+            elif hasattr(self.application, 'updater') and self.application.updater:
                 await self.application.updater.start_polling(drop_pending_updates=True)
                 logger.info("Telegram bot polling started successfully")
             else:
@@ -148,7 +236,7 @@ class TelegramBot:
                 await self.stop()
                 return False
             
-            logger.info("Telegram bot started successfully (polling mode)")
+            logger.info(f"Telegram bot started successfully ({'webhook' if use_webhook else 'polling'} mode)")
             
             return True
         except Exception as e:
@@ -164,6 +252,14 @@ class TelegramBot:
             return  # Already stopped
         
         try:
+            if self.webhook_active:
+                self.webhook_active = False
+                try:
+                    await self.application.bot.delete_webhook()
+                    logger.info("Telegram bot webhook removed")
+                except Exception as e:
+                    logger.warning(f"Error removing webhook: {e}")
+            
             # Stop updater first (if it exists and is running)
             if hasattr(self.application, 'updater') and self.application.updater:
                 try:
@@ -184,14 +280,29 @@ class TelegramBot:
             logger.info("Telegram bot stopped")
     
     async def start_backup_task(self):
-        """Start automatic backup task"""
-        await self.stop_backup_task()
+        """Start automatic backup task (a running task picks up new settings in place)"""
         await self.load_settings()
         
+        if self.backup_task and not self.backup_task.done() and self.backup_enabled and self.admin_ids:
+            logger.info(f"Automatic backup task rescheduled: interval={self.backup_interval} {self.backup_interval_unit}")
+            return
+        
+        await self.stop_backup_task()
+        
         if self.backup_enabled and self.admin_ids:
             self.backup_task = asyncio.create_task(self._backup_loop())
             logger.info(f"Automatic backup task started: interval={self.backup_interval} {self.backup_interval_unit}")
     
+    def verify_webhook_secret(self, token: Optional[str]) -> bool:
+        """Check the secret token Telegram sends with every webhook request"""
+        return bool(self._webhook_token) and secrets.compare_digest((token or "").encode(), self._webhook_token.encode())
+    
+    async def process_webhook_update(self, data: Dict[str, Any]):
+        """Queue an update received on the webhook endpoint for the running application"""
+        from telegram import Update  # type: ignore
+        
+        await self.application.update_queue.put(Update.de_json(data, self.application.bot))
+    
     async def stop_backup_task(self):
         """Stop automatic backup task"""
         if self.backup_task:
@@ -205,42 +316,51 @@ class TelegramBot:
     
     async def _backup_loop(self):
         """Background task for automatic backups"""
+        loop = asyncio.get_running_loop()
+        last_run = loop.time()
         try:
             while True:
-                await self.load_settings()
-                
-                if not self.backup_enabled or not self.admin_ids:
-                    await asyncio.sleep(60)
-                    continue
-                
-                if self.backup_interval_unit == "hours":
-                    sleep_seconds = self.backup_interval * 3600
+                if self.backup_enabled and self.admin_ids:
+                    if self.backup_interval_unit == "hours":
+                        interval_seconds = self.backup_interval * 3600
+                    else:
+                        interval_seconds = self.backup_interval * 60
+                    # Sleep until the absolute due time so backup duration doesn't accumulate drift
+                    timeout = max(last_run + interval_seconds - loop.time(), 0)
                 else:
-                    sleep_seconds = self.backup_interval * 60
+                    timeout = None
                 
-                await asyncio.sleep(sleep_seconds)
-                
-                if not self.backup_enabled:
+                try:
+                    await asyncio.wait_for(self._settings_changed.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                else:
+                    # Settings changed: reload and recompute the due time from the last run
+                    self._settings_changed.clear()
+                    await self.load_settings()
                     continue
                 
+                last_run = loop.time()
                 try:
-                    backup_path = await self.create_backup()
-                    if backup_path and self.application and self.application.bot:
-                        for admin_id_str in self.admin_ids:
-                            try:
-                                admin_id = int(admin_id_str)
-                                with open(backup_path, 'rb') as f:
-                                    await self.application.bot.send_document(
-                                        chat_id=admin_id,
-                                        document=f,
-                                        filename=f"smite_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip",
-                                        caption=f"🔄 Automatic backup - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-                                    )
-                            except Exception as e:
-                                logger.error(f"Failed to send backup to admin {admin_id_str}: {e}")
+                    backup = await self.create_backup()
+                    if backup and self.application and self.application.bot:
+                        from telegram import InputFile  # type: ignore
+                        
+                        now = datetime.now()
+                        # Read the archive once and share the same upload payload with every admin
+                        with backup:
+                            document = InputFile(backup.read(), filename=f"smite_backup_{now.strftime('%Y%m%d_%H%M%S')}.zip")
+                        caption = f"🔄 Automatic backup - {now.strftime('%Y-%m-%d %H:%M:%S')}"
+                        
+                        admin_ids = list(self._admin_ids_int)
+                        results = await asyncio.gather(
+                            *(self._send_backup_to_admin(admin_id, document, caption) for admin_id in admin_ids),
+                            return_exceptions=True
+                        )
+                        for admin_id, result in zip(admin_ids, results):
+                            if isinstance(result, Exception):
+                                logger.error(f"Failed to send backup to admin {admin_id}: {result}")
                         
-                        if os.path.exists(backup_path):
-                            os.remove(backup_path)
                         logger.info("Automatic backup sent successfully")
                 except Exception as e:
                     logger.error(f"Error in automatic backup: {e}", exc_info=True)
@@ -250,16 +370,20 @@ class TelegramBot:
         except Exception as e:
             logger.error(f"Backup loop error: {e}", exc_info=True)
     
+    async def _send_backup_to_admin(self, chat_id: int, document: InputFile, caption: str):
+        """Send backup archive to a single admin"""
+        await self.application.bot.send_document(
+            chat_id=chat_id,
+            document=document,
+            caption=caption
+        )
+    
+    @admin_required
     async def cmd_start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /start command"""
         try:
             user_id = update.effective_user.id
             reply_markup = self._get_keyboard(user_id)
-            
-            if not self.is_admin(user_id):
-                await update.message.reply_text(self.t(user_id, "access_denied"), reply_markup=reply_markup)
-                return
-            
             await update.message.reply_text(self.t(user_id, "welcome"), reply_markup=reply_markup)
         except Exception as e:
             logger.error(f"Error in cmd_start: {e}", exc_info=True)
@@ -271,18 +395,22 @@ class TelegramBot:
                 pass
     
     def _get_keyboard(self, user_id: int) -> ReplyKeyboardMarkup:
-        """Get persistent keyboard markup"""
-        keyboard = [
-            [
-                KeyboardButton(self.t(user_id, 'node_stats')),
-                KeyboardButton(self.t(user_id, 'tunnel_stats'))
-            ],
-            [
-                KeyboardButton(self.t(user_id, 'logs')),
-                KeyboardButton(self.t(user_id, 'backup'))
-            ],
-        ]
-        return ReplyKeyboardMarkup(keyboard, resize_keyboard=True, one_time_keyboard=False)
+        """Get persistent keyboard markup (same for every user, built once)"""
+        if self._keyboard is None:
+            from telegram import KeyboardButton, ReplyKeyboardMarkup  # type: ignore
+            
+            keyboard = [
+                [
+                    KeyboardButton(self.t(user_id, 'node_stats')),
+                    KeyboardButton(self.t(user_id, 'tunnel_stats'))
+                ],
+                [
+                    KeyboardButton(self.t(user_id, 'logs')),
+                    KeyboardButton(self.t(user_id, 'backup'))
+                ],
+            ]
+            self._keyboard = ReplyKeyboardMarkup(keyboard, resize_keyboard=True, one_time_keyboard=False)
+        return self._keyboard
     
     async def show_main_menu(self, message_or_query):
         """Show main menu with persistent keyboard buttons"""
@@ -317,97 +445,56 @@ class TelegramBot:
             except:
                 pass
     
+    @admin_required
     async def cmd_help(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /help command"""
-        user_id = update.effective_user.id
-        reply_markup = self._get_keyboard(user_id)
-        
-        if not self.is_admin(user_id):
-            await update.message.reply_text(self.t(user_id, "access_denied"), reply_markup=reply_markup)
-            return
-        
-        help_text = """📋 Available Commands:
-
-/start - Show main menu
-/nodes - List all nodes
-/tunnels - List all tunnels
-/status - Show panel status
-/logs - Show recent logs
-/backup - Create and send backup
-
-Use buttons in messages to interact with nodes and tunnels."""
+        reply_markup = self._get_keyboard(update.effective_user.id)
         
-        await update.message.reply_text(help_text, reply_markup=reply_markup)
+        await update.message.reply_text(HELP_TEXT, reply_markup=reply_markup)
     
+    @admin_required
     async def cmd_nodes(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /nodes command"""
-        user_id = update.effective_user.id
-        reply_markup = self._get_keyboard(user_id)
-        
-        if not self.is_admin(user_id):
-            await update.message.reply_text(self.t(user_id, "access_denied"), reply_markup=reply_markup)
-            return
-        
         await self.cmd_nodes_callback(update.message)
     
+    @admin_required
     async def cmd_tunnels(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /tunnels command"""
-        user_id = update.effective_user.id
-        reply_markup = self._get_keyboard(user_id)
-        
-        if not self.is_admin(user_id):
-            await update.message.reply_text(self.t(user_id, "access_denied"), reply_markup=reply_markup)
-            return
-        
         await self.cmd_tunnels_callback(update.message)
     
+    @admin_required
     async def cmd_status(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /status command"""
-        user_id = update.effective_user.id
-        reply_markup = self._get_keyboard(user_id)
-        
-        if not self.is_admin(user_id):
-            await update.message.reply_text(self.t(user_id, "access_denied"), reply_markup=reply_markup)
-            return
-        
         await self.cmd_status_callback(update.message)
     
+    @admin_required
     async def cmd_backup(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /backup command"""
-        user_id = update.effective_user.id
-        reply_markup = self._get_keyboard(user_id)
-        
-        if not self.is_admin(user_id):
-            await update.message.reply_text(self.t(user_id, "access_denied"), reply_markup=reply_markup)
-            return
+        reply_markup = self._get_keyboard(update.effective_user.id)
         
         await update.message.reply_text("📦 Creating backup...", reply_markup=reply_markup)
         
         try:
-            backup_path = await self.create_backup()
-            if backup_path:
-                with open(backup_path, 'rb') as f:
-                    await update.message.reply_document(
-                        document=f,
-                        filename=f"smite_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip",
-                        caption="✅ Backup created successfully",
-                        reply_markup=reply_markup
-                    )
-                os.remove(backup_path)
+            backup = await self.create_backup()
+            if backup:
+                with backup:
+                    data = backup.read()
+                await update.message.reply_document(
+                    document=data,
+                    filename=f"smite_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip",
+                    caption="✅ Backup created successfully",
+                    reply_markup=reply_markup
+                )
             else:
                 await update.message.reply_text("❌ Failed to create backup", reply_markup=reply_markup)
         except Exception as e:
             logger.error(f"Error creating backup: {e}", exc_info=True)
             await update.message.reply_text(f"❌ Error creating backup: {str(e)}", reply_markup=reply_markup)
     
+    @admin_required
     async def cmd_logs(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /logs command"""
-        user_id = update.effective_user.id
-        reply_markup = self._get_keyboard(user_id)
-        
-        if not self.is_admin(user_id):
-            await update.message.reply_text(self.t(user_id, "access_denied"), reply_markup=reply_markup)
-            return
+        reply_markup = self._get_keyboard(update.effective_user.id)
         
         try:
             async with httpx.AsyncClient() as client:
@@ -415,9 +502,9 @@ Use buttons in messages to interact with nodes and tunnels."""
                 if response.status_code == 200:
                     logs = response.json().get("logs", [])
                     if logs:
-                        text = "📋 Recent Logs:\n\n"
-                        for log in logs[-10:]:
-                            text += f"`{log.get('level', 'INFO')}` {log.get('message', '')[:100]}\n\n"
+                        text = "📋 Recent Logs:\n\n" + "".join(
+                            f"`{log.get('level', 'INFO')}` {log.get('message', '')[:100]}\n\n" for log in logs[-10:]
+                        )
                         await update.message.reply_text(text, parse_mode="Markdown", reply_markup=reply_markup)
                     else:
                         await update.message.reply_text("No logs available.", reply_markup=reply_markup)
@@ -427,14 +514,29 @@ Use buttons in messages to interact with nodes and tunnels."""
             logger.error(f"Error fetching logs: {e}", exc_info=True)
             await update.message.reply_text(f"Error: {str(e)}", reply_markup=reply_markup)
     
-    async def create_backup(self) -> Optional[str]:
-        """Create backup archive"""
+    async def create_backup(self) -> Optional[IO[bytes]]:
+        """Create backup archive without blocking the event loop"""
+        return await asyncio.to_thread(self._sync_create_backup)
+    
+    def _sync_create_backup(self) -> Optional[IO[bytes]]:
+        """Create backup archive (blocking, runs in a worker thread)"""
         try:
+            import zipfile
             from app.config import settings
-            import os
             
-            backup_dir = Path("/tmp/smite_backup")
-            backup_dir.mkdir(exist_ok=True)
+            # (source file, name inside the archive)
+            entries: List[Tuple[Path, str]] = []
+            # (live database, name inside the archive), snapshotted while the archive is written
+            db_entry: Optional[Tuple[Path, str]] = None
+            
+            # The live database and its journal files are captured via the SQLite backup API instead
+            db_path = Path(settings.db_path).resolve()
+            db_files = {db_path} | {db_path.with_name(db_path.name + suffix) for suffix in ("-wal", "-shm", "-journal")}
+            
+            def add_tree(src_dir: Path, prefix: str):
+                for file_path in sorted(src_dir.rglob("*")):
+                    if file_path.is_file() and file_path.resolve() not in db_files:
+                        entries.append((file_path, f"{prefix}/{file_path.relative_to(src_dir).as_posix()}"))
             
             # Find panel root directory
             data_dir = Path("/opt/smite/panel/data")
@@ -448,7 +550,9 @@ Use buttons in messages to interact with nodes and tunnels."""
                 data_dir = panel_root / "data"
             
             if data_dir.exists():
-                shutil.copytree(data_dir, backup_dir / "data", dirs_exist_ok=True)
+                add_tree(data_dir, "data")
+                if db_path.exists() and data_dir.resolve() in db_path.parents:
+                    db_entry = (db_path, f"data/{db_path.relative_to(data_dir.resolve()).as_posix()}")
                 logger.info(f"Backed up data folder from: {data_dir}")
             
             panel_root = data_dir.parent if data_dir.exists() else Path("/opt/smite/panel")
@@ -462,35 +566,19 @@ Use buttons in messages to interact with nodes and tunnels."""
             
             certs_dir = panel_root / "certs"
             if certs_dir.exists():
-                shutil.copytree(certs_dir, backup_dir / "certs", dirs_exist_ok=True)
-            
-            node_cert_path = Path(settings.node_cert_path)
-            if not node_cert_path.is_absolute():
-                node_cert_path = panel_root / node_cert_path
-            if node_cert_path.exists():
-                (backup_dir / "node_certs").mkdir(exist_ok=True)
-                shutil.copy2(node_cert_path, backup_dir / "node_certs" / "ca.crt")
-            
-            node_key_path = Path(settings.node_key_path)
-            if not node_key_path.is_absolute():
-                node_key_path = panel_root / node_key_path
-            if node_key_path.exists():
-                (backup_dir / "node_certs").mkdir(exist_ok=True)
-                shutil.copy2(node_key_path, backup_dir / "node_certs" / "ca.key")
-            
-            server_cert_path = Path(settings.node_server_cert_path)
-            if not server_cert_path.is_absolute():
-                server_cert_path = panel_root / server_cert_path
-            if server_cert_path.exists():
-                (backup_dir / "server_certs").mkdir(exist_ok=True)
-                shutil.copy2(server_cert_path, backup_dir / "server_certs" / "ca-server.crt")
-            
-            server_key_path = Path(settings.node_server_key_path)
-            if not server_key_path.is_absolute():
-                server_key_path = panel_root / server_key_path
-            if server_key_path.exists():
-                (backup_dir / "server_certs").mkdir(exist_ok=True)
-                shutil.copy2(server_key_path, backup_dir / "server_certs" / "ca-server.key")
+                add_tree(certs_dir, "certs")
+            
+            for cert_setting, arcname in [
+                (settings.node_cert_path, "node_certs/ca.crt"),
+                (settings.node_key_path, "node_certs/ca.key"),
+                (settings.node_server_cert_path, "server_certs/ca-server.crt"),
+                (settings.node_server_key_path, "server_certs/ca-server.key"),
+            ]:
+                cert_path = Path(cert_setting)
+                if not cert_path.is_absolute():
+                    cert_path = panel_root / cert_path
+                if cert_path.exists():
+                    entries.append((cert_path, arcname))
             
             # Backup .env and docker-compose.yml from mounted config directory
             # These files are mounted into the container at /app/config/
@@ -518,7 +606,7 @@ Use buttons in messages to interact with nodes and tunnels."""
             
             if env_file:
                 # Use 'env' instead of '.env' to make it visible (not hidden)
-                shutil.copy2(env_file, backup_dir / "env")
+                entries.append((env_file, "env"))
                 logger.info(f"Backed up .env from: {env_file}")
             
             # Find and backup docker-compose.yml
@@ -529,42 +617,67 @@ Use buttons in messages to interact with nodes and tunnels."""
                     break
             
             if compose_file:
-                shutil.copy2(compose_file, backup_dir / "docker-compose.yml")
+                entries.append((compose_file, "docker-compose.yml"))
                 logger.info(f"Backed up docker-compose.yml from: {compose_file}")
             
-            from app.config import settings
             if settings.https_enabled and settings.panel_domain:
                 nginx_dir = panel_root / "nginx"
                 if nginx_dir.exists():
-                    shutil.copytree(nginx_dir, backup_dir / "nginx", dirs_exist_ok=True)
+                    add_tree(nginx_dir, "nginx")
+                
+                domain_dir = Path("/etc/letsencrypt") / "live" / settings.panel_domain
+                if domain_dir.exists():
+                    for cert_file in ["fullchain.pem", "privkey.pem", "chain.pem", "cert.pem"]:
+                        cert_path = domain_dir / cert_file
+                        if cert_path.exists():
+                            entries.append((cert_path, f"letsencrypt/live/{settings.panel_domain}/{cert_file}"))
+            
+            # Level 0 stores entries uncompressed; 1-9 are explicit deflate levels
+            if self.backup_compress_level == 0:
+                compression, compresslevel = zipfile.ZIP_STORED, None
+            else:
+                compression, compresslevel = zipfile.ZIP_DEFLATED, self.backup_compress_level
+            
+            # Telegram uploads load the whole payload anyway, so the archive is built in memory
+            backup = io.BytesIO()
+            with tempfile.TemporaryDirectory() as tmp_dir, \
+                    zipfile.ZipFile(backup, 'w', compression, compresslevel=compresslevel) as zipf:
+                for src_path, arcname in entries:
+                    if src_path.stat().st_size < BACKUP_STORE_THRESHOLD:
+                        # Tiny certs/configs gain nothing from deflate, store them as-is
+                        info = zipfile.ZipInfo.from_file(src_path, arcname)
+                        info.compress_type = zipfile.ZIP_STORED
+                        zipf.writestr(info, src_path.read_bytes())
+                    else:
+                        zipf.write(src_path, arcname)
                 
-                letsencrypt_dir = Path("/etc/letsencrypt")
-                if letsencrypt_dir.exists():
-                    domain_dir = letsencrypt_dir / "live" / settings.panel_domain
-                    if domain_dir.exists():
-                        (backup_dir / "letsencrypt" / "live" / settings.panel_domain).mkdir(parents=True, exist_ok=True)
-                        for cert_file in ["fullchain.pem", "privkey.pem", "chain.pem", "cert.pem"]:
-                            cert_path = domain_dir / cert_file
-                            if cert_path.exists():
-                                shutil.copy2(cert_path, backup_dir / "letsencrypt" / "live" / settings.panel_domain / cert_file)
-            
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            backup_file = f"/tmp/smite_backup_{timestamp}.zip"
-            
-            with zipfile.ZipFile(backup_file, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                for root, dirs, files in os.walk(backup_dir):
-                    for file in files:
-                        file_path = Path(root) / file
-                        arcname = file_path.relative_to(backup_dir)
-                        zipf.write(file_path, arcname)
-            
-            shutil.rmtree(backup_dir)
-            
-            return backup_file
+                if db_entry:
+                    src_path, arcname = db_entry
+                    snapshot_path = Path(tmp_dir) / src_path.name
+                    try:
+                        self._snapshot_db(src_path, snapshot_path)
+                    except sqlite3.Error as e:
+                        logger.warning(f"SQLite backup of {src_path} failed, copying file as-is: {e}")
+                        snapshot_path = src_path
+                    zipf.write(snapshot_path, arcname)
+            
+            backup.seek(0)
+            return backup
         except Exception as e:
             logger.error(f"Error creating backup: {e}", exc_info=True)
             return None
     
+    @staticmethod
+    def _snapshot_db(db_path: Path, dest_path: Path):
+        """Take a consistent snapshot of the live SQLite database into dest_path"""
+        src = sqlite3.connect(f"{db_path.as_uri()}?mode=ro", uri=True)
+        dst = sqlite3.connect(dest_path)
+        try:
+            src.backup(dst)
+        finally:
+            dst.close()
+            src.close()
+    
     async def handle_text_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle text messages from persistent keyboard"""
         try:
@@ -608,7 +721,7 @@ Use buttons in messages to interact with nodes and tunnels."""
                 return
             
             if not self.is_admin(query.from_user.id):
-                await query.edit_message_text(self.t(query.from_user.id, "access_denied"))
+                await query.edit_message_text(ACCESS_DENIED)
                 return
         except Exception as e:
             logger.error(f"Error in handle_callback: {e}", exc_info=True)
@@ -635,169 +748,141 @@ Use buttons in messages to interact with nodes and tunnels."""
         elif data == "cmd_status":
             await self.cmd_status_callback(query)
     
+    @staticmethod
+    def _get_user_id(message_or_query) -> int:
+        """Get user id from a message or callback query"""
+        if hasattr(message_or_query, 'from_user'):
+            return message_or_query.from_user.id
+        if hasattr(message_or_query, 'message') and hasattr(message_or_query.message, 'from_user'):
+            return message_or_query.message.from_user.id
+        return message_or_query.chat.id if hasattr(message_or_query, 'chat') else 0
+    
+    async def _respond(self, message_or_query, text: str, user_id: int):
+        """Edit the callback message in place, or reply to a plain message with the persistent keyboard"""
+        if hasattr(message_or_query, 'edit_message_text') and message_or_query:
+            await message_or_query.edit_message_text(text)
+        elif hasattr(message_or_query, 'reply_text'):
+            await message_or_query.reply_text(text, reply_markup=self._get_keyboard(user_id))
+        else:
+            await message_or_query.message.reply_text(text, reply_markup=self._get_keyboard(user_id))
+    
+    async def _render_nodes(self, user_id: int) -> str:
+        """Build node stats text"""
+        async with engine.connect() as conn:
+            result = await conn.execute(select(
+                select(func.count(Node.id)).scalar_subquery(),
+                select(func.count(Node.id)).where(Node.status == "active").scalar_subquery(),
+            ))
+            total, active = result.one()
+            
+            if not total:
+                return self.t(user_id, "no_nodes")
+            
+            result = await conn.execute(select(
+                Node.id,
+                Node.name,
+                Node.status,
+                func.coalesce(Node.node_metadata["role"].as_string(), "unknown").label("role"),
+            ).order_by(Node.registered_at, Node.id).limit(NODES_DISPLAY_LIMIT))
+            nodes = result.all()
+        
+        lines = [
+            f"📊 {self.t(user_id, 'node_stats')}:\n\n",
+            f"Total: {total}\n",
+            f"Active: {active}\n\n",
+        ]
+        
+        for node_id, name, node_status, role in nodes:
+            status = "🟢" if node_status == "active" else "🔴"
+            lines.append(f"{status} {name} ({role})\n   ID: {node_id[:8]}...\n\n")
+        
+        if total > NODES_DISPLAY_LIMIT:
+            lines.append(f"... and {total - NODES_DISPLAY_LIMIT} more")
+        
+        return "".join(lines)
+    
+    async def _render_tunnels(self, user_id: int) -> str:
+        """Build tunnel stats text"""
+        async with engine.connect() as conn:
+            result = await conn.execute(select(
+                select(func.count(Tunnel.id)).scalar_subquery(),
+                select(func.count(Tunnel.id)).where(Tunnel.status == "active").scalar_subquery(),
+            ))
+            total, active = result.one()
+            
+            if not total:
+                return self.t(user_id, "no_tunnels")
+            
+            result = await conn.execute(select(Tunnel.name, Tunnel.status, Tunnel.core).order_by(Tunnel.created_at, Tunnel.id).limit(TUNNELS_DISPLAY_LIMIT))
+            tunnels = result.all()
+        
+        lines = [
+            f"📊 {self.t(user_id, 'tunnel_stats')}:\n\n",
+            f"Total: {total}\n",
+            f"Active: {active}\n",
+            f"Error: {total - active}\n\n",
+        ]
+        
+        for name, tunnel_status, core in tunnels:
+            status = "🟢" if tunnel_status == "active" else "🔴"
+            lines.append(f"{status} {name} ({core})\n")
+        
+        if total > TUNNELS_DISPLAY_LIMIT:
+            lines.append(f"\n... and {total - TUNNELS_DISPLAY_LIMIT} more")
+        
+        return "".join(lines)
+    
+    async def _render_status(self) -> str:
+        """Build panel status text"""
+        async with engine.connect() as conn:
+            # All four counts in a single round trip
+            result = await conn.execute(select(
+                select(func.count(Node.id)).where(Node.status == "active").scalar_subquery(),
+                select(func.count(Node.id)).scalar_subquery(),
+                select(func.count(Tunnel.id)).where(Tunnel.status == "active").scalar_subquery(),
+                select(func.count(Tunnel.id)).scalar_subquery(),
+            ))
+            active_nodes, total_nodes, active_tunnels, total_tunnels = result.one()
+        
+        return f"""📊 Panel Status:
+
+🖥️ Nodes: {active_nodes}/{total_nodes} active
+🔗 Tunnels: {active_tunnels}/{total_tunnels} active
+"""
+    
     async def cmd_nodes_callback(self, message_or_query):
         """Handle nodes command from callback"""
+        user_id = self._get_user_id(message_or_query)
         try:
-            # Get user_id and message object
-            if hasattr(message_or_query, 'from_user'):
-                user_id = message_or_query.from_user.id
-                message = message_or_query
-            elif hasattr(message_or_query, 'message') and hasattr(message_or_query.message, 'from_user'):
-                user_id = message_or_query.message.from_user.id
-                message = message_or_query.message
-            else:
-                user_id = message_or_query.chat.id if hasattr(message_or_query, 'chat') else 0
-                message = message_or_query
-            
-            async with AsyncSessionLocal() as session:
-                result = await session.execute(select(Node))
-                nodes = result.scalars().all()
-                
-                reply_markup = self._get_keyboard(user_id)
-                
-                if not nodes:
-                    text = self.t(user_id, "no_nodes")
-                    if hasattr(message, 'edit_message_text') and message:
-                        await message.edit_message_text(text)
-                    elif hasattr(message, 'reply_text'):
-                        await message.reply_text(text, reply_markup=reply_markup)
-                    return
-                
-                text = f"📊 {self.t(user_id, 'node_stats')}:\n\n"
-                active = sum(1 for n in nodes if n.status == "active")
-                text += f"Total: {len(nodes)}\n"
-                text += f"Active: {active}\n\n"
-                
-                for node in nodes:
-                    status = "🟢" if node.status == "active" else "🔴"
-                    role = node.node_metadata.get("role", "unknown") if node.node_metadata else "unknown"
-                    text += f"{status} {node.name} ({role})\n"
-                    text += f"   ID: {node.id[:8]}...\n\n"
-                
-                if hasattr(message, 'edit_message_text') and message:
-                    await message.edit_message_text(text)
-                elif hasattr(message, 'reply_text'):
-                    await message.reply_text(text, reply_markup=reply_markup)
+            await self._respond(message_or_query, await self._render_nodes(user_id), user_id)
         except Exception as e:
             logger.error(f"Error in cmd_nodes_callback: {e}", exc_info=True)
             try:
-                user_id = message_or_query.from_user.id if hasattr(message_or_query, 'from_user') else 0
-                reply_markup = self._get_keyboard(user_id)
-                if hasattr(message_or_query, 'reply_text'):
-                    await message_or_query.reply_text("❌ Error loading nodes", reply_markup=reply_markup)
-                elif hasattr(message_or_query, 'edit_message_text') and message_or_query:
-                    await message_or_query.edit_message_text("❌ Error loading nodes")
-                elif hasattr(message_or_query, 'message'):
-                    await message_or_query.message.reply_text("❌ Error loading nodes", reply_markup=reply_markup)
+                await self._respond(message_or_query, "❌ Error loading nodes", user_id)
             except:
                 pass
     
     async def cmd_tunnels_callback(self, message_or_query):
         """Handle tunnels command from callback"""
+        user_id = self._get_user_id(message_or_query)
         try:
-            if hasattr(message_or_query, 'from_user'):
-                user_id = message_or_query.from_user.id
-            elif hasattr(message_or_query, 'message') and hasattr(message_or_query.message, 'from_user'):
-                user_id = message_or_query.message.from_user.id
-            else:
-                user_id = message_or_query.chat.id if hasattr(message_or_query, 'chat') else 0
-            
-            async with AsyncSessionLocal() as session:
-                result = await session.execute(select(Tunnel))
-                tunnels = result.scalars().all()
-                
-                reply_markup = self._get_keyboard(user_id)
-                
-                if not tunnels:
-                    text = self.t(user_id, "no_tunnels")
-                    if hasattr(message_or_query, 'edit_message_text') and message_or_query:
-                        await message_or_query.edit_message_text(text)
-                    elif hasattr(message_or_query, 'reply_text'):
-                        await message_or_query.reply_text(text, reply_markup=reply_markup)
-                    else:
-                        await message_or_query.message.reply_text(text, reply_markup=reply_markup)
-                    return
-                
-                text = f"📊 {self.t(user_id, 'tunnel_stats')}:\n\n"
-                active = sum(1 for t in tunnels if t.status == "active")
-                text += f"Total: {len(tunnels)}\n"
-                text += f"Active: {active}\n"
-                text += f"Error: {len(tunnels) - active}\n\n"
-                
-                for tunnel in tunnels[:10]:
-                    status = "🟢" if tunnel.status == "active" else "🔴"
-                    text += f"{status} {tunnel.name} ({tunnel.core})\n"
-                
-                if len(tunnels) > 10:
-                    text += f"\n... and {len(tunnels) - 10} more"
-                
-                if hasattr(message_or_query, 'edit_message_text') and message_or_query:
-                    await message_or_query.edit_message_text(text)
-                elif hasattr(message_or_query, 'reply_text'):
-                    reply_markup = self._get_keyboard(user_id)
-                    await message_or_query.reply_text(text, reply_markup=reply_markup)
-                else:
-                    reply_markup = self._get_keyboard(user_id)
-                    await message_or_query.message.reply_text(text, reply_markup=reply_markup)
+            await self._respond(message_or_query, await self._render_tunnels(user_id), user_id)
         except Exception as e:
             logger.error(f"Error in cmd_tunnels_callback: {e}", exc_info=True)
             try:
-                user_id = message_or_query.from_user.id if hasattr(message_or_query, 'from_user') else 0
-                reply_markup = self._get_keyboard(user_id)
-                if hasattr(message_or_query, 'reply_text'):
-                    await message_or_query.reply_text("❌ Error loading tunnels", reply_markup=reply_markup)
-                elif hasattr(message_or_query, 'edit_message_text') and message_or_query:
-                    await message_or_query.edit_message_text("❌ Error loading tunnels")
-                elif hasattr(message_or_query, 'message'):
-                    await message_or_query.message.reply_text("❌ Error loading tunnels", reply_markup=reply_markup)
+                await self._respond(message_or_query, "❌ Error loading tunnels", user_id)
             except:
                 pass
     
     async def cmd_status_callback(self, message_or_query):
         """Handle status command from callback"""
+        user_id = self._get_user_id(message_or_query)
         try:
-            if hasattr(message_or_query, 'from_user'):
-                user_id = message_or_query.from_user.id
-            elif hasattr(message_or_query, 'message') and hasattr(message_or_query.message, 'from_user'):
-                user_id = message_or_query.message.from_user.id
-            else:
-                user_id = message_or_query.chat.id if hasattr(message_or_query, 'chat') else 0
-            
-            async with AsyncSessionLocal() as session:
-                nodes_result = await session.execute(select(Node))
-                nodes = nodes_result.scalars().all()
-                
-                tunnels_result = await session.execute(select(Tunnel))
-                tunnels = tunnels_result.scalars().all()
-                
-                active_nodes = sum(1 for n in nodes if n.status == "active")
-                active_tunnels = sum(1 for t in tunnels if t.status == "active")
-                
-                text = f"""📊 Panel Status:
-
-🖥️ Nodes: {active_nodes}/{len(nodes)} active
-🔗 Tunnels: {active_tunnels}/{len(tunnels)} active
-"""
-                
-                if hasattr(message_or_query, 'edit_message_text') and message_or_query:
-                    await message_or_query.edit_message_text(text)
-                elif hasattr(message_or_query, 'reply_text'):
-                    reply_markup = self._get_keyboard(user_id)
-                    await message_or_query.reply_text(text, reply_markup=reply_markup)
-                else:
-                    reply_markup = self._get_keyboard(user_id)
-                    await message_or_query.message.reply_text(text, reply_markup=reply_markup)
+            await self._respond(message_or_query, await self._render_status(), user_id)
         except Exception as e:
             logger.error(f"Error in cmd_status_callback: {e}", exc_info=True)
             try:
-                user_id = message_or_query.from_user.id if hasattr(message_or_query, 'from_user') else 0
-                if hasattr(message_or_query, 'reply_text'):
-                    reply_markup = self._get_keyboard(user_id)
-                    await message_or_query.reply_text("❌ Error loading status", reply_markup=reply_markup)
-                elif hasattr(message_or_query, 'edit_message_text') and message_or_query:
-                    await message_or_query.edit_message_text("❌ Error loading status")
-                elif hasattr(message_or_query, 'message'):
-                    await message_or_query.message.reply_text("❌ Error loading status", reply_markup=reply_markup)
+                await self._respond(message_or_query, "❌ Error loading status", user_id)
             except:
                 pass
     
@@ -810,17 +895,17 @@ Use buttons in messages to interact with nodes and tunnels."""
         await query.edit_message_text("📦 Creating backup...")
         
         try:
-            backup_path = await self.create_backup()
-            if backup_path:
+            backup = await self.create_backup()
+            if backup:
                 reply_markup = self._get_keyboard(user_id)
-                with open(backup_path, 'rb') as f:
-                    await query.message.reply_document(
-                        document=f,
-                        filename=f"smite_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip",
-                        caption="✅ Backup created successfully",
-                        reply_markup=reply_markup
-                    )
-                os.remove(backup_path)
+                with backup:
+                    data = backup.read()
+                await query.message.reply_document(
+                    document=data,
+                    filename=f"smite_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip",
+                    caption="✅ Backup created successfully",
+                    reply_markup=reply_markup
+                )
                 await query.edit_message_text("✅ Backup created and sent successfully!")
             else:
                 await query.edit_message_text("❌ Failed to create backup")
@@ -836,9 +921,9 @@ Use buttons in messages to interact with nodes and tunnels."""
                 if response.status_code == 200:
                     logs = response.json().get("logs", [])
                     if logs:
-                        text = "📋 Recent Logs:\n\n"
-                        for log in logs[-10:]:
-                            text += f"`{log.get('level', 'INFO')}` {log.get('message', '')[:100]}\n\n"
+                        text = "📋 Recent Logs:\n\n" + "".join(
+                            f"`{log.get('level', 'INFO')}` {log.get('message', '')[:100]}\n\n" for log in logs[-10:]
+                        )
                         await query.edit_message_text(text, parse_mode="Markdown")
                     else:
                         await query.edit_message_text("No logs available.")